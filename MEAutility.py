@@ -11,7 +11,6 @@ voltage = [mV]
 """
 
 import numpy as np
-import copy
 
 def get_elcoords(xoffset, dim, pitch, electrode_name, sortlist, **kwargs):
     """ Calculate electrode positions according to the arguments.
@@ -47,11 +46,17 @@ def get_elcoords(xoffset, dim, pitch, electrode_name, sortlist, **kwargs):
         if sum(coldims) != np.prod(dim):
             raise ValueError('Dimensions in Neuronexus-32-channel probe do not match.')
         zshift = -pitch[1] * (coldims[1] - 1) / 2.
-        x = np.array([0.] * sum(coldims))
-        y = np.concatenate([[-pitch[0]] * coldims[0], [0.] * coldims[1], [pitch[0]] * coldims[2]])
-        z = np.concatenate((np.arange(pitch[1] / 2., coldims[0] * pitch[1], pitch[1]),
-                            np.arange(0., coldims[1] * pitch[1], pitch[1]),
-                            np.arange(pitch[1] / 2., coldims[2] * pitch[1], pitch[1]))) + zshift
+        x = np.zeros(sum(coldims))
+        y = np.empty(sum(coldims))
+        z = np.empty(sum(coldims))
+        # outer columns are shifted by half a pitch in z
+        col_y = [-pitch[0], 0., pitch[0]]
+        col_z = [pitch[1] / 2., 0., pitch[1] / 2.]
+        offset = 0
+        for ncol, cy, cz in zip(coldims, col_y, col_z):
+            y[offset:offset + ncol] = cy
+            z[offset:offset + ncol] = cz + pitch[1] * np.arange(ncol) + zshift
+            offset += ncol
     elif 'neuropixels' in electrode_name.lower():
         if 'v1' in electrode_name.lower():
             # checkerboard structure
@@ -78,10 +83,10 @@ def get_elcoords(xoffset, dim, pitch, electrode_name, sortlist, **kwargs):
                              np.reshape(y, (y.size, 1)),
                              np.reshape(z, (z.size, 1))), axis=1)
     # resort electrodes in case
-    el_pos_sorted = copy.deepcopy(el_pos)
+    el_pos_sorted = el_pos.copy()
     if sortlist is not None:
-        for i, si in enumerate(sortlist):
-            el_pos_sorted[si] = el_pos[i]
+        sortlist = np.asarray(sortlist, dtype=int)
+        el_pos_sorted[sortlist] = el_pos[:len(sortlist)]
 
     return el_pos_sorted
 
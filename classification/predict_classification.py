@@ -43,9 +43,7 @@ class Prediction:
         self.all_categories = ['BP', 'BTC', 'ChC', 'DBC', 'LBC', 'MC', 'NBC',
                                'NGC', 'SBC', 'STPC', 'TTPC1', 'TTPC2', 'UTPC']
 
-        self.cell_dict = {}
-        for cc in self.all_categories:
-            self.cell_dict.update({int(np.argwhere(np.array(self.all_categories) == cc)): cc})
+        self.cell_dict = {i: cc for i, cc in enumerate(self.all_categories)}
 
         # Load validation spikes
         self.val_data_dir = join(self.model_path, 'validation_data')
@@ -77,9 +75,11 @@ class Prediction:
         self.fully = self.model_info['CNN']['fully']
         self.out = self.model_info['CNN']['outputs']
         self.classification = self.model_info['General']['classification']
+        self.batch_size = 1000
 
         curr_eval_dir = self.val_data_dir
         validation_run = 0
+        val_data = False
         if os.path.isdir(self.val_data_dir):
             if self.classification == 'binary':
                 self.spikes, self.features, self.loc, self.rot, self.cat, self.mcat = \
@@ -89,11 +89,7 @@ class Prediction:
                 self.mcat = self.cat
             num_spikes = len(self.cat)
 
-            self.cell_dict = {}
-            for cc in self.all_categories:
-                self.cell_dict.update({int(np.argwhere(np.array(self.all_categories) == cc)): cc})
             val_data = True
-            mcat_strings = np.array([self.cell_dict[cc] for cc in self.mcat])
 
         MEAname = self.model_info['General']['electrode name']
         MEAdims = self.model_info['General']['MEA dimension']
@@ -110,124 +106,127 @@ class Prediction:
         pos = MEA.get_elcoords(x_plane, **elinfo)
         self.mea_pos = pos
         self.mea_dim = MEAdims
-        self.num_categories = len(np.unique(self.cat))
 
         tf.reset_default_graph()
 
-        if val_data:
-            print('\nClassifying on validation data from trainel CNN model')
-            test_features_tf = tf.constant(self.features, dtype=np.float32)
-            test_cat_tf = tf.one_hot(self.cat, depth=self.num_categories, dtype=np.int64)
-            # prediction
-            test_pred = self.inference(test_features_tf)
-            true = tf.argmax(test_cat_tf, 1)
-            guessed = tf.argmax(test_pred, 1)
-            correct_prediction = tf.equal(guessed, true)
-
-            with tf.Session() as sess:
-                saver = tf.train.Saver()
-                ckpt = tf.train.get_checkpoint_state(join(self.model_path, 'train', 'run%d' % validation_run))
-                if ckpt and ckpt.model_checkpoint_path:
-                    relative_model_path_idx = ckpt.model_checkpoint_path.index('models/')
-                    relative_model_path = join(data_dir, 'classification',
-                                               ckpt.model_checkpoint_path[relative_model_path_idx:])
-                    saver.restore(sess, relative_model_path)
-                    global_step = ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1]
-                else:
-                    print('No checkpoint file found')
-                    return
-
-                accuracy = tf.reduce_mean(tf.cast(correct_prediction, "float"))
-                
-                self.acc, self.guess = sess.run([accuracy, guessed], feed_dict={self.keep_prob: 1.0})
-
-            tf.reset_default_graph()
-            # pred_cat = [self.pred_dict[cc] for cc in self.guessed[v]]
-
-            print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
-    '','   RESULTS   ',' Accuracies for validation data of trained CNN ',''))
-            print('Data from %s' % '/'.join(self.val_data_dir.split(os.sep)[-2:]))
+        # build the inference graph and restore the trained model only once
+        # static input shape (flattened per spike), as fixed by the MEA dimension and inputs
+        features_tf = tf.placeholder(tf.float32, shape=[None, int(np.prod(self.mea_dim)) * self.inputs],
+                                     name='features')
+        # mark the conv/bias/relu ops of the fixed-size network for XLA compilation (CPU and GPU)
+        with tf.contrib.compiler.jit.experimental_jit_scope():
+            guessed = tf.argmax(self.inference(features_tf), 1)
+
+        # also let XLA auto-cluster the remaining graph (TF1 applies this to GPU ops only)
+        config = tf.ConfigProto()
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+        with tf.Session(config=config) as sess:
+            saver = tf.train.Saver()
+            ckpt = tf.train.get_checkpoint_state(join(self.model_path, 'train', 'run%d' % validation_run))
+            if ckpt and ckpt.model_checkpoint_path:
+                relative_model_path_idx = ckpt.model_checkpoint_path.index('models/')
+                relative_model_path = join(data_dir, 'classification',
+                                           ckpt.model_checkpoint_path[relative_model_path_idx:])
+                saver.restore(sess, relative_model_path)
+                global_step = ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1]
+            else:
+                print('No checkpoint file found')
+                return
+
+            if val_data:
+                print('\nClassifying on validation data from trainel CNN model')
+                self.guess = self.run_batches(sess, guessed, features_tf, self.features)
+                self.acc = np.mean(self.guess == self.cat)
+                # pred_cat = [self.pred_dict[cc] for cc in self.guessed[v]]
+
+                print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
+        '','   RESULTS   ',' Accuracies for validation data of trained CNN ',''))
+                print('Data from %s' % '/'.join(self.val_data_dir.split(os.sep)[-2:]))
             
-            print('\n'+60*'=')
-            print('Average validation accuracy: %.2f %%' % (100.*self.acc))
-            print(60*'=')
-
-            print('\n{0:*^60}\n'.format(' Cell specific results '))
-            for cc in self.cell_dict.values():
-                ids = np.argwhere(mcat_strings==cc)
-                nncat = len(ids)
-                ccacc = float(len(np.where(self.guess[ids]==self.cat[ids])[0]))/nncat
-                print('Accuracy for cells of type %s: %.2f %%' 
-                      % (cc, 100*ccacc))
-
-            print('\n{0:*^60}\n'.format(' END RESULTS '))
-
-
-        if spike_folder is not None:
-            self.model_type = os.path.normpath(spike_folder).split(os.sep)[-3]
-            print('\nClassifying neurons with ', self.model_type, ' model EAPs from spike folder:\n')
-            print('%s\n' % spike_folder)
-            spikefiles = [f for f in os.listdir(spike_folder) if 'spikes' in f]
-            cell_names = ['_'.join(ss.split('_')[3:-1]) for ss in spikefiles]
-            self.other_spikes, self.other_loc, self.other_rot, other_cat, oetype,\
-                omid, oloaded_cat = load_EAP_data(spike_folder,cell_names,self.all_categories)
-
-            self.other_features = self.return_features(self.other_spikes)
-            self.other_cat = []
-            other_features_tf = tf.constant(self.other_features, dtype=np.float32)
-            for c in other_cat:
-                if 'L5b' in c or c in self.exc_categories:
-                    self.other_cat.append(0)
-                else:
-                    self.other_cat.append(1)
-            self.other_cat = np.array(self.other_cat)
-
-            other_cat_tf = tf.one_hot(self.other_cat, depth=self.num_categories, dtype=np.int64)
-            # prediction
-            test_pred = self.inference(other_features_tf)
-            true = tf.argmax(other_cat_tf, 1)
-            guessed = tf.argmax(test_pred, 1)
-            correct_prediction = tf.equal(guessed, true)
-
-            with tf.Session() as sess:
-                saver = tf.train.Saver()
-                ckpt = tf.train.get_checkpoint_state(join(self.model_path, 'train', 'run%d' % validation_run))
-                if ckpt and ckpt.model_checkpoint_path:
-                    relative_model_path_idx = ckpt.model_checkpoint_path.index('models/')
-                    relative_model_path = join(data_dir, 'classification',
-                                               ckpt.model_checkpoint_path[relative_model_path_idx:])
-                    saver.restore(sess, relative_model_path)
-                    global_step = ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1]
-                else:
-                    print('No checkpoint file found')
-                    return
-
-
-                accuracy = tf.reduce_mean(tf.cast(correct_prediction, "float"))
-
-                self.other_acc, self.other_guess = sess.run([accuracy, guessed], feed_dict={self.keep_prob: 1.0})
-
-            print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
-    '','   RESULTS   ',' Accuracies for data from spike folder ',''))
-            print('Data from %s' % spike_folder)
+                print('\n'+60*'=')
+                print('Average validation accuracy: %.2f %%' % (100.*self.acc))
+                print(60*'=')
+
+                print('\n{0:*^60}\n'.format(' Cell specific results '))
+                # count spikes and correct guesses of each cell type in one pass
+                correct = (self.guess == self.cat).astype(float)
+                nncat = np.bincount(self.mcat, minlength=len(self.all_categories))
+                ncorrect = np.bincount(self.mcat, weights=correct, minlength=len(self.all_categories))
+                for idx, cc in self.cell_dict.items():
+                    if nncat[idx] > 0:
+                        print('Accuracy for cells of type %s: %.2f %%' 
+                              % (cc, 100*ncorrect[idx]/nncat[idx]))
+
+                print('\n{0:*^60}\n'.format(' END RESULTS '))
+
+
+            if spike_folder is not None:
+                self.model_type = os.path.normpath(spike_folder).split(os.sep)[-3]
+                print('\nClassifying neurons with ', self.model_type, ' model EAPs from spike folder:\n')
+                print('%s\n' % spike_folder)
+                spikefiles = [f for f in os.listdir(spike_folder) if 'spikes' in f]
+                cell_names = ['_'.join(ss.split('_')[3:-1]) for ss in spikefiles]
+                self.other_spikes, self.other_loc, self.other_rot, other_cat, oetype,\
+                    omid, oloaded_cat = load_EAP_data(spike_folder,cell_names,self.all_categories)
+
+                self.other_features = self.return_features(self.other_spikes)
+                self.other_cat = []
+                for c in other_cat:
+                    if 'L5b' in c or c in self.exc_categories:
+                        self.other_cat.append(0)
+                    else:
+                        self.other_cat.append(1)
+                self.other_cat = np.array(self.other_cat)
+
+                # prediction
+                self.other_guess = self.run_batches(sess, guessed, features_tf, self.other_features)
+                self.other_acc = np.mean(self.other_guess == self.other_cat)
+
+                print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
+        '','   RESULTS   ',' Accuracies for data from spike folder ',''))
+                print('Data from %s' % spike_folder)
             
-            print('\n'+60*'=')
-            print('Average accuracy: %.2f %%' % (100.*self.other_acc))
-            print(60*'=')
+                print('\n'+60*'=')
+                print('Average accuracy: %.2f %%' % (100.*self.other_acc))
+                print(60*'=')
 
-            print('\n{0:*^60}\n'.format(' Cell specific results '))
-            for cc in np.unique(other_cat):
-                ids = np.argwhere(other_cat==cc)
-                nncat = len(ids)
-                ccacc = float(len(np.where(self.other_guess[ids]==self.other_cat[ids])[0]))/nncat
-                print('Accuracy for cells of type %s: %.2f %%' 
-                      % (cc, 100*ccacc))
+                print('\n{0:*^60}\n'.format(' Cell specific results '))
+                other_types, other_idx = np.unique(other_cat, return_inverse=True)
+                correct = (self.other_guess == self.other_cat).astype(float)
+                nncat = np.bincount(other_idx)
+                ncorrect = np.bincount(other_idx, weights=correct)
+                for cc, ncc, ncorr in zip(other_types, nncat, ncorrect):
+                    print('Accuracy for cells of type %s: %.2f %%' 
+                          % (cc, 100*ncorr/ncc))
 
-            print('\n{0:*^60}\n'.format(' END RESULTS '))
+                print('\n{0:*^60}\n'.format(' END RESULTS '))
 
         tf.reset_default_graph()
 
 
+    def run_batches(self, sess, output, features_tf, features):
+        ''' evaluate output tensor on features, fed to the graph in batches
+
+        Parameters:
+        -----------
+        sess: tf.Session, session with restored model
+        output: tensor, tensor to evaluate
+        features_tf: tensor, placeholder for the features
+        features: array_like, features to feed
+
+        Returns:
+        -------
+        out: array_like, output concatenated over batches
+        '''
+        features = np.reshape(features, (len(features), int(np.prod(features.shape[1:]))))
+        # at least one (possibly empty) batch, so empty inputs give an empty output
+        n_batches = max(1, int(np.ceil(float(len(features)) / self.batch_size)))
+        return np.concatenate([sess.run(output, feed_dict={
+                                   features_tf: features[b * self.batch_size:(b + 1) * self.batch_size],
+                                   self.keep_prob: 1.0})
+                               for b in range(n_batches)])
+
+
     def return_features(self, spikes):
         ''' extract features from spikes
         '''
@@ -240,51 +239,39 @@ class Prediction:
         elif self.feat_type == 'NaRep':
             features = get_EAP_features(spikes, ['Na', 'Rep'], \
                                         dt=self.dt, threshold_detect=self.threshold_detect)
-            features = np.array([features['na'], features['rep']])
+            # stack features along the last axis
+            features = np.stack([features['na'], features['rep']], axis=-1)
             self.inputs = 2  # fwhm and widths
-            # swapaxes to move features at the end
-            features = features.swapaxes(0, 1)
-            features = features.swapaxes(1, 2)
         elif self.feat_type == 'AW':
             features = get_EAP_features(spikes,['A','W'],\
                                              dt=self.dt,threshold_detect=self.threshold_detect)
-            features = np.array([features['amps'],features['widths']])
+            # stack features along the last axis
+            features = np.stack([features['amps'],features['widths']], axis=-1)
             self.inputs = 2  # amps and widths
-            # swapaxes to move features at the end
-            features = features.swapaxes(0, 1)
-            features = features.swapaxes(1, 2)
         elif self.feat_type == 'FW':
             features = get_EAP_features(spikes,['F','W'],\
                                              dt=self.dt,threshold_detect=self.threshold_detect)
-            features = np.array([features['fwhm'],features['widths']])
+            # stack features along the last axis
+            features = np.stack([features['fwhm'],features['widths']], axis=-1)
             self.inputs = 2  # fwhm and widths
-            # swapaxes to move features at the end
-            features = features.swapaxes(0, 1)
-            features = features.swapaxes(1, 2)
         elif self.feat_type == 'AF':
             features = get_EAP_features(spikes,['A','F'],\
                                              dt=self.dt,threshold_detect=self.threshold_detect)
-            features = np.array([features['amps'],features['fwhm']])
+            # stack features along the last axis
+            features = np.stack([features['amps'],features['fwhm']], axis=-1)
             self.inputs = 2  # amps and fwhm
-            # swapaxes to move features at the end
-            features = features.swapaxes(0, 1)
-            features = features.swapaxes(1, 2)
         elif self.feat_type == 'AFW':
             features = get_EAP_features(spikes,['A','F','W'],\
                                              dt=self.dt,threshold_detect=self.threshold_detect)
-            features = np.array([features['amps'],features['fwhm'],features['widths']])
+            # stack features along the last axis
+            features = np.stack([features['amps'],features['fwhm'],features['widths']], axis=-1)
             self.inputs = 3  # amps, fwhms and widths
-            # swapaxes to move features at the end
-            features = features.swapaxes(0, 1)
-            features = features.swapaxes(1, 2)
         elif self.feat_type == 'FWRS':
             features = get_EAP_features(spikes,['F','W', 'R', 'S'],\
                                              dt=self.dt,threshold_detect=self.threshold_detect)
-            features = np.array([features['fwhm'],features['widths'],features['ratio'],features['speed']])
+            # stack features along the last axis
+            features = np.stack([features['fwhm'],features['widths'],features['ratio'],features['speed']], axis=-1)
             self.inputs = 4  # fwhms, widths, ratios, speed
-            # swapaxes to move features at the end
-            features = features.swapaxes(0, 1)
-            features = features.swapaxes(1, 2)
         elif self.feat_type == '3d':
             print('Downsampling spikes...')
             # downsampled_spikes = ss.resample(self.spikes, self.spikes.shape[2] // self.downsampling_factor, axis=2)
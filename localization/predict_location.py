@@ -42,9 +42,7 @@ class Prediction:
         self.all_categories = ['BP', 'BTC', 'ChC', 'DBC', 'LBC', 'MC', 'NBC',
                                'NGC', 'SBC', 'STPC', 'TTPC1', 'TTPC2', 'UTPC']
 
-        self.cell_dict = {}
-        for cc in self.all_categories:
-            self.cell_dict.update({int(np.argwhere(np.array(self.all_categories) == cc)): cc})
+        self.cell_dict = {i: cc for i, cc in enumerate(self.all_categories)}
 
         # Load validation spikes
         self.val_data_dir = join(self.model_path, 'validation_data')
@@ -75,16 +73,15 @@ class Prediction:
         self.l2depth = self.model_info['CNN']['l2depth']
         self.fully = self.model_info['CNN']['fully']
         self.out = self.model_info['CNN']['outputs']
+        self.batch_size = 1000
 
         curr_eval_dir = self.val_data_dir
         validation_run = 0
+        val_data = False
         if os.path.isdir(self.val_data_dir):
             self.spikes, self.features, self.loc, self.rot, self.cat, = load_validation_data(self.val_data_dir)
             num_spikes = len(self.cat)
 
-            self.cell_dict = {}
-            for cc in self.all_categories:
-                self.cell_dict.update({int(np.argwhere(np.array(self.all_categories) == cc)): cc})
             val_data = True
             cat_strings = np.array([self.cell_dict[cc] for cc in self.cat])
 
@@ -107,88 +104,76 @@ class Prediction:
 
         tf.reset_default_graph()
 
-        if val_data:
-            print('\nLocalizing neurons from validation data of CNN model')
-
-            test_features_tf = tf.constant(self.features, dtype=np.float32)
-            # prediction
-            pred_loc = self.inference(test_features_tf)
-            validation_run = 0
-
-            with tf.Session() as sess:
-                saver = tf.train.Saver()
-                ckpt = tf.train.get_checkpoint_state(join(self.model_path, 'train', 'run%d' % validation_run))
-                if ckpt and ckpt.model_checkpoint_path:
-                    relative_model_path_idx = ckpt.model_checkpoint_path.index('models/')
-                    relative_model_path = join(data_dir, 'localization',
-                                               ckpt.model_checkpoint_path[relative_model_path_idx:])
-                    saver.restore(sess, relative_model_path)
-                    global_step = ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1]
-                else:
-                    print('No checkpoint file found')
-                    return
-
-                pred = sess.run(pred_loc, feed_dict={self.keep_prob: 1.0})
+        # build the inference graph and restore the trained model only once
+        # static input shape (flattened per spike), as fixed by the MEA dimension and inputs
+        features_tf = tf.placeholder(tf.float32, shape=[None, int(np.prod(self.mea_dim)) * self.inputs],
+                                     name='features')
+        # mark the conv/bias/relu ops of the fixed-size network for XLA compilation (CPU and GPU)
+        with tf.contrib.compiler.jit.experimental_jit_scope():
+            pred_loc = self.inference(features_tf)
+
+        # also let XLA auto-cluster the remaining graph (TF1 applies this to GPU ops only)
+        config = tf.ConfigProto()
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+        with tf.Session(config=config) as sess:
+            saver = tf.train.Saver()
+            ckpt = tf.train.get_checkpoint_state(join(self.model_path, 'train', 'run%d' % validation_run))
+            if ckpt and ckpt.model_checkpoint_path:
+                relative_model_path_idx = ckpt.model_checkpoint_path.index('models/')
+                relative_model_path = join(data_dir, 'localization',
+                                           ckpt.model_checkpoint_path[relative_model_path_idx:])
+                saver.restore(sess, relative_model_path)
+                global_step = ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1]
+            else:
+                print('No checkpoint file found')
+                return
+
+            if val_data:
+                print('\nLocalizing neurons from validation data of CNN model')
+
+                pred = self.run_batches(sess, pred_loc, features_tf, self.features)
                 err = np.array([np.linalg.norm(pred[e, :] - self.loc[e, :]) for e in range(pred.shape[0])])
                 err_x = np.array([np.linalg.norm(pred[e, 0] - self.loc[e, 0]) for e in range(pred.shape[0])])
                 err_y = np.array([np.linalg.norm(pred[e, 1] - self.loc[e, 1]) for e in range(pred.shape[0])])
                 err_z = np.array([np.linalg.norm(pred[e, 2] - self.loc[e, 2]) for e in range(pred.shape[0])])
                 err_dim = np.array([err_x, err_y, err_z]).transpose()
 
-            tf.reset_default_graph()
-
-            print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
-    '','   RESULTS   ',' Accuracies for validation data of trained CNN ',''))
-            print('Data from %s' % '/'.join(self.val_data_dir.split(os.sep)[-2:]))
+                print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
+        '','   RESULTS   ',' Accuracies for validation data of trained CNN ',''))
+                print('Data from %s' % '/'.join(self.val_data_dir.split(os.sep)[-2:]))
             
-            print('\n'+60*'=')
-            print('Average validation error: %.2f +- %.2f um' % 
-                  (np.mean(err),np.std(err)))
-            print(60*'=')
-
-            print('\n{0:*^60}\n'.format(' Dimension specific results '))
-            print('Mean error in x dimension: %.2f um' % err_x.mean())
-            print('Std of error in x dimension: %.2f um' % err_x.std())
-            print('Mean error in y dimension: %.2f um' % err_y.mean())
-            print('Std of error in y dimension: %.2f um' % err_y.std())
-            print('Mean error in z dimension: %.2f um' % err_z.mean())
-            print('Std of error in z dimension: %.2f um' % err_z.std())
-
-            print('\n{0:*^60}\n'.format(' Cell specific results '))
-            for cc in self.cell_dict.values():
-                ids = np.argwhere(cat_strings==cc)
-                print('Error for cells of type %s: %.2f +- %.2f um' 
-                      % (cc, err[ids].mean(),err[ids].std()))
-
-            print('\n{0:*^60}\n'.format(' END RESULTS '))
-
-        if spike_folder is not None:
-            self.model_type = os.path.abspath(spike_folder).split(os.sep)[-3]
-            print('\nLocalizing neurons with ', self.model_type, ' model EAPs from spike folder:\n  ')
-            print('%s\n' % spike_folder)
-            spikefiles = [f for f in os.listdir(spike_folder) if 'spikes' in f]
-            cell_names = ['_'.join(ss.split('_')[3:-1]) for ss in spikefiles]
-            self.other_spikes, self.other_loc, self.other_rot, ocat, oetype, omid,\
-                oloaded_cat = load_EAP_data(spike_folder,cell_names,self.all_categories)
-            self.other_features = self.return_features(self.other_spikes)
-
-            other_features_tf = tf.constant(self.other_features, dtype=np.float32)
-            other_pred_loc = self.inference(other_features_tf)
-
-            with tf.Session() as sess:
-                saver = tf.train.Saver()
-                ckpt = tf.train.get_checkpoint_state(join(self.model_path, 'train', 'run%d' % validation_run))
-                if ckpt and ckpt.model_checkpoint_path:
-                    relative_model_path_idx = ckpt.model_checkpoint_path.index('models/')
-                    relative_model_path = join(data_dir, 'localization',
-                                               ckpt.model_checkpoint_path[relative_model_path_idx:])
-                    saver.restore(sess, relative_model_path)
-                    global_step = ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1]
-                else:
-                    print('No checkpoint file found')
-                    return
-
-                other_pred = sess.run(other_pred_loc, feed_dict={self.keep_prob: 1.0})
+                print('\n'+60*'=')
+                print('Average validation error: %.2f +- %.2f um' % 
+                      (np.mean(err),np.std(err)))
+                print(60*'=')
+
+                print('\n{0:*^60}\n'.format(' Dimension specific results '))
+                print('Mean error in x dimension: %.2f um' % err_x.mean())
+                print('Std of error in x dimension: %.2f um' % err_x.std())
+                print('Mean error in y dimension: %.2f um' % err_y.mean())
+                print('Std of error in y dimension: %.2f um' % err_y.std())
+                print('Mean error in z dimension: %.2f um' % err_z.mean())
+                print('Std of error in z dimension: %.2f um' % err_z.std())
+
+                print('\n{0:*^60}\n'.format(' Cell specific results '))
+                for cc in self.cell_dict.values():
+                    ids = np.argwhere(cat_strings==cc)
+                    print('Error for cells of type %s: %.2f +- %.2f um' 
+                          % (cc, err[ids].mean(),err[ids].std()))
+
+                print('\n{0:*^60}\n'.format(' END RESULTS '))
+
+            if spike_folder is not None:
+                self.model_type = os.path.abspath(spike_folder).split(os.sep)[-3]
+                print('\nLocalizing neurons with ', self.model_type, ' model EAPs from spike folder:\n  ')
+                print('%s\n' % spike_folder)
+                spikefiles = [f for f in os.listdir(spike_folder) if 'spikes' in f]
+                cell_names = ['_'.join(ss.split('_')[3:-1]) for ss in spikefiles]
+                self.other_spikes, self.other_loc, self.other_rot, ocat, oetype, omid,\
+                    oloaded_cat = load_EAP_data(spike_folder,cell_names,self.all_categories)
+                self.other_features = self.return_features(self.other_spikes)
+
+                other_pred = self.run_batches(sess, pred_loc, features_tf, self.other_features)
                 other_err = np.array([np.linalg.norm(other_pred[e, :] - self.other_loc[e, :])
                                       for e in range(other_pred.shape[0])])
                 other_err_x = np.array([np.linalg.norm(other_pred[e, 0] - self.other_loc[e, 0])
@@ -197,35 +182,55 @@ class Prediction:
                                         for e in range(other_pred.shape[0])])
                 other_err_z = np.array([np.linalg.norm(other_pred[e, 2] - self.other_loc[e, 2])
                                         for e in range(other_pred.shape[0])])
-                other_err_dim = np.array([err_x, err_y, err_z]).transpose()
-
-
-            tf.reset_default_graph()
+                other_err_dim = np.array([other_err_x, other_err_y, other_err_z]).transpose()
 
-            print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
-                '','   RESULTS   ',' Accuracies for data from spike folder',''))
-            print('Data from %s' % spike_folder)
+                print('\n{0:*^60}\n{1:*^60}\n{2:*^60}\n{3:*^60}'.format(
+                    '','   RESULTS   ',' Accuracies for data from spike folder',''))
+                print('Data from %s' % spike_folder)
             
-            print('\n'+60*'=')
-            print('Average error: %.2f +- %.2f um' % 
-                  (np.mean(other_err),np.std(other_err)))
-            print(60*'=')
+                print('\n'+60*'=')
+                print('Average error: %.2f +- %.2f um' % 
+                      (np.mean(other_err),np.std(other_err)))
+                print(60*'=')
+
+                print('\n{0:*^60}\n'.format(' Dimension specific results '))
+                print('Mean error in x dimension: %.2f um' % other_err_x.mean())
+                print('Std of error in x dimension: %.2f um' % other_err_x.std())
+                print('Mean error in y dimension: %.2f um' % other_err_y.mean())
+                print('Std of error in y dimension: %.2f um' % other_err_y.std())
+                print('Mean error in z dimension: %.2f um' % other_err_z.mean())
+                print('Std of error in z dimension: %.2f um' % other_err_z.std())
+
+                print('\n{0:*^60}\n'.format(' Cell specific results '))
+                for cc in np.unique(ocat):
+                    ids = np.argwhere(ocat==cc)
+                    print('Error for cells of type %s: %.2f +- %.2f um' 
+                          % (cc, other_err[ids].mean(),other_err[ids].std()))
+
+                print('\n{0:*^60}\n'.format(' END RESULTS '))
 
-            print('\n{0:*^60}\n'.format(' Dimension specific results '))
-            print('Mean error in x dimension: %.2f um' % other_err_x.mean())
-            print('Std of error in x dimension: %.2f um' % other_err_x.std())
-            print('Mean error in y dimension: %.2f um' % other_err_y.mean())
-            print('Std of error in y dimension: %.2f um' % other_err_y.std())
-            print('Mean error in z dimension: %.2f um' % other_err_z.mean())
-            print('Std of error in z dimension: %.2f um' % other_err_z.std())
+        tf.reset_default_graph()
 
-            print('\n{0:*^60}\n'.format(' Cell specific results '))
-            for cc in np.unique(ocat):
-                ids = np.argwhere(ocat==cc)
-                print('Error for cells of type %s: %.2f +- %.2f um' 
-                      % (cc, other_err[ids].mean(),other_err[ids].std()))
 
-            print('\n{0:*^60}\n'.format(' END RESULTS '))
+    def run_batches(self, sess, output, features_tf, features):
+        ''' evaluate output tensor on features, fed to the graph in batches
+        Parameters:
+        -----------
+        sess: tf.Session, session with restored model
+        output: tensor, tensor to evaluate
+        features_tf: tensor, placeholder for the features
+        features: array_like, features to feed
+        Return:
+        -------
+        out: array_like, output concatenated over batches
+        '''
+        features = np.reshape(features, (len(features), int(np.prod(features.shape[1:]))))
+        # at least one (possibly empty) batch, so empty inputs give an empty output
+        n_batches = max(1, int(np.ceil(float(len(features)) / self.batch_size)))
+        return np.concatenate([sess.run(output, feed_dict={
+                                   features_tf: features[b * self.batch_size:(b + 1) * self.batch_size],
+                                   self.keep_prob: 1.0})
+                               for b in range(n_batches)])
 
 
     def return_features(self, spikes):
@@ -240,11 +245,9 @@ class Prediction:
         elif self.feat_type == 'NaRep':
             features = get_EAP_features(spikes, ['Na', 'Rep'], \
                                         dt=self.dt, threshold_detect=self.threshold_detect)
-            features = np.array([features['na'], features['rep']])
+            # stack features along the last axis
+            features = np.stack([features['na'], features['rep']], axis=-1)
             self.inputs = 2  # fwhm and widths
-            # swapaxes to move features at the end
-            features = features.swapaxes(0, 1)
-            features = features.swapaxes(1, 2)
         elif self.feat_type == '3d':
             print('Downsampling spikes...')
             # downsampled_spikes = ss.resample(self.spikes, self.spikes.shape[2] // self.downsampling_factor, axis=2)
@@ -196,9 +196,9 @@ def load_validation_data(validation_folder,load_mcat=False):
     Returns:
     --------
     spikes : array_like
-        Loaded EAPs.
+        Loaded EAPs (read-only, memory-mapped).
     feat : array_like
-        Extracted EAP features.
+        Extracted EAP features (read-only, memory-mapped).
     locs : array_like
         Positions of neurons evoking the EAP.
     rots : array_like
@@ -210,20 +210,19 @@ def load_validation_data(validation_folder,load_mcat=False):
     """
     print("Loading validation spike data ...")
 
-    spikes = np.load(join(validation_folder, 'val_spikes.npy'))  # [:spikes_per_cell, :, :]
-    feat = np.load(join(validation_folder, 'val_feat.npy'))  # [:spikes_per_cell, :, :]
+    # memory-map the large arrays so they are only read from disk when sliced
+    spikes = np.load(join(validation_folder, 'val_spikes.npy'), mmap_mode='r')  # [:spikes_per_cell, :, :]
+    feat = np.load(join(validation_folder, 'val_feat.npy'), mmap_mode='r')  # [:spikes_per_cell, :, :]
     locs = np.load(join(validation_folder, 'val_loc.npy'))  # [:spikes_per_cell, :]
     rots = np.load(join(validation_folder, 'val_rot.npy'))  # [:spikes_per_cell, :]
     cats = np.load(join(validation_folder, 'val_cat.npy'))
     if load_mcat:
         mcats = np.load(join(validation_folder, 'val_mcat.npy'))
         print("Done loading spike data ...")
-        return np.array(spikes), np.array(feat), np.array(locs),\
-            np.array(rots), np.array(cats), np.array(mcats)
+        return spikes, feat, locs, rots, cats, mcats
     else:
         print("Done loading spike data ...")
-        return np.array(spikes), np.array(feat), np.array(locs),\
-            np.array(rots), np.array(cats)
+        return spikes, feat, locs, rots, cats
 
 
 def get_EAP_features(EAP,feat_list,dt=None,EAP_times=None,threshold_detect=5.,normalize=False):